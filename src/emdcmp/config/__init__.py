@@ -36,6 +36,7 @@ class Config(ValConfig):
 
     class paths:
         figures : Path
+        checkpoints: Optional[Path]
 
         # This is typically used as a library: don’t create random paths on users’ computers
         #ensure_dir_exists = validator('figures', allow_reuse=True)(ensure_dir_exists)
@@ -43,6 +44,8 @@ class Config(ValConfig):
     class mp:
         max_cores: int
         maxtasksperchild: Union[int,None]
+        start_method: Optional[Literal["fork", "spawn", "forkserver"]]
+        min_task_time: float
 
     class caching:
         """
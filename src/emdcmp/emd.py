@@ -176,7 +176,16 @@ class interp1d(Serializable, scipy.interpolate.interp1d):
         fill_value: Literal["extrapolate"]|Tuple[Array, Array]|Array
         
         def encode(f):
-            return (f.x, f.y, f._kind, f.axis, f.copy, f.bounds_error, f.fill_value)
+            # Spline kinds ("cubic", etc.) are stored as "spline"; recover them as the spline order
+            kind = f._spline.k if f._kind == "spline" else f._kind
+            return (f.x, f.y, kind, f.axis, f.copy, f.bounds_error, f.fill_value)
+
+    def __reduce__(self):
+        # Pickle only the constructor arguments: internal tables (e.g. spline
+        # coefficients for kind="cubic") are rebuilt when unpickling, and pickles
+        # do not depend on scipy’s private attributes.
+        # `x` is stored sorted, so we can skip sorting with `assume_sorted=True`.
+        return (type(self), (*self.Data.encode(self), True))
 
 
 # %% [markdown] editable=true slideshow={"slide_type": ""}
@@ -1270,23 +1270,41 @@ def generate_path_hierarchical_beta(
     """
     # Validation
     res = int(res)  # sourcery skip: remove-unnecessary-cast
-    if Phistart >= Phiend:
-        raise ValueError("`Phistart` must be strictly smaller than `Phiend`. "
-                         f"Received:\n  {Phistart=}\n  {Phiend=}")
     # if not (len(Phi) == len(qstar) == len(Mvar)):
     #     raise ValueError("`Phi`, `qstar` and `Mvar` must all have "
     #                      "the same shape. Values received have the respective shapes "
     #                      f"{np.shape(Phi)}, {np.shape(qstar)}, {np.shape(Mvar)}")
-    if res < 1:
-        raise ValueError("`res` must be greater or equal to 1.")
     rng = np.random.default_rng(rng)  # No-op if `rng` is already a Generator
     # Interpolation
-    N  = 2**res + 1
-    Φarr = np.linspace(Phistart, Phiend, N)
+    Φarr = _path_grid(res, Phistart, Phiend)
     qsarr = qstar(Φarr)
     # Pre-computations
     Mvar = c * deltaEMD(Φarr)**2
     # Algorithm
+    return Φarr, _fill_path_hierarchical_beta(qsarr, Mvar, qstart, qend, res, rng)
+
+
+def _path_grid(res: int, Phistart: float, Phiend: float) -> Array[float,1]:
+    """Validate the path parameters and return the abscissa `Φarr` of a path."""
+    if Phistart >= Phiend:
+        raise ValueError("`Phistart` must be strictly smaller than `Phiend`. "
+                         f"Received:\n  {Phistart=}\n  {Phiend=}")
+    if res < 1:
+        raise ValueError("`res` must be greater or equal to 1.")
+    return np.linspace(Phistart, Phiend, 2**res + 1)
+
+
+def _fill_path_hierarchical_beta(
+        qsarr: Array[float,1], Mvar: Array[float,1],
+        qstart: float, qend: float, res: int, rng: RNGenerator
+    ) -> Array[float,1]:
+    """
+    Core of `generate_path_hierarchical_beta`, operating on `qstar` and the
+    metric variance already evaluated on the path abscissa.
+    Since these do not depend on the sampled path, `generate_quantile_paths`
+    evaluates them once and reuses them for every path.
+    """
+    N = len(qsarr)
     qhat = np.empty(N)
     qhat[0] = qstart
     qhat[-1] = qend
@@ -1305,7 +1323,7 @@ def generate_path_hierarchical_beta(
         else:
             x1 = draw_from_beta(r, v, rng=rng)
         qhat[i] = qhat[i-Δi] + d * x1
-    return Φarr, qhat
+    return qhat
 
 
 # %% editable=true slideshow={"slide_type": ""} tags=["active-ipynb", "hide-input"]
@@ -1398,6 +1416,13 @@ def generate_quantile_paths(qstar: Callable, deltaEMD: Callable, c: float,
     beneficial for integration with Simpson's rule.
     """
     rng = np.random.default_rng(rng)
+    res = int(res)  # sourcery skip: remove-unnecessary-cast
+    # `qstar` and `deltaEMD` are the same for every path: evaluate them only once
+    Φarr = _path_grid(res, Phistart, Phiend)
+    qsarr = qstar(Φarr)
+    δarr = deltaEMD(Φarr)
+    Mvar = c * δarr**2
+    σstart, σend = math.sqrt(c)*δarr[0], math.sqrt(c)*δarr[-1]
     total = M + previous_M
     progbar_is_queue = ("multiprocessing.queues.Queue" in str(type(progbar).mro()))  # Not using `isinstance` avoids having to import multiprocessing & multiprocessing.queues
     if isinstance(progbar, str) and progbar == "auto":
@@ -1413,19 +1438,18 @@ def generate_quantile_paths(qstar: Callable, deltaEMD: Callable, c: float,
             progbar.refresh()
     for r in range(M):  # sourcery skip: for-index-underscore
         for _ in range(100):  # In practice, this should almost always work on the first try; 100 failures would mean a really pathological probability
-            qstart  = rng.normal(qstar(Phistart) , math.sqrt(c)*deltaEMD(Phistart))
-            qend = rng.normal(qstar(Phiend), math.sqrt(c)*deltaEMD(Phiend))
+            qstart  = rng.normal(qsarr[0] , σstart)
+            qend = rng.normal(qsarr[-1], σend)
             if qstart < qend:
                 break
         else:
             raise RuntimeError("Unable to generate start and end points such that "
                                "start < end. Are you sure `qstar` is compatible "
                                "with monotone paths ?")
-        Φhat, qhat = generate_path_hierarchical_beta(
-            qstar, deltaEMD, c, qstart=qstart, qend=qend,
-            res=res, rng=rng, Phistart=Phistart, Phiend=Phiend)
+        qhat = _fill_path_hierarchical_beta(
+            qsarr, Mvar, qstart=qstart, qend=qend, res=res, rng=rng)
         
-        yield Φhat, qhat
+        yield Φarr.copy(), qhat
         
         if progbar_is_queue:
             progbar.put(total)
@@ -39,6 +39,7 @@ from .config import config  # Python script
 
 # %% editable=true slideshow={"slide_type": ""}
 import abc
+import os
 import psutil
 import logging
 import time
@@ -283,32 +284,36 @@ class CalibrateOutput(TaskOutput):
 # Below we define the two functions to compute $\Bemd{}$ and $\Bconf{}$; these will be the abscissa and ordinate in the calibration plot.
 # Both functions take an arguments a data generation model, risk functions for candidate models $A$ and $B$, and a number of data points to generate.
 #
-# - $\Bemd{}$ needs to be recomputed for each value of $c$, so we also pass $c$ as a parameter. $\Bemd{}$ computations are relatively expensive, and there are a lot of them to do during calibration, so we want to dispatch `compute_Bemd` to different multiprocessing (MP) processes. This has two consequences:
+# - $\Bemd{}$ needs to be recomputed for each value of $c$, so we also pass the list of $c$ values as a parameter. $\Bemd{}$ computations are relatively expensive, and there are a lot of them to do during calibration, so we want to dispatch `compute_Bemd` to different multiprocessing (MP) processes. This has three consequences:
 #
-#   - The `multiprocessing.Pool.imap` function we use to dispatch function calls can only iterate over one argument. To accomodate this, we combine the data model and $c$ value into a tuple `datamodel_c`, which is unpacked within the `compute_Bemd` function.
+#   - The `multiprocessing.Pool.imap` function we use to dispatch function calls can only iterate over one argument. To accomodate this, we combine the experiment and its integer id into a tuple `i_ω`, which is unpacked within the `compute_Bemd` function.
+#   - Each MP task loops over all values of $c$ for one experiment. This way the observed data, the candidate model fits and the empirical PPFs (which do not depend on $c$) are computed only once per experiment, instead of once per $c$ value.
 #   - All arguments should be pickleable, as pickle is used to send data to subprocesses.
 #
 # - $\Bconf{}$ only needs to be computed once per data model. $\Bconf{}$ is also typically cheap (unless the data generation model is very complicated), so it is not worth dispatching to an MP subprocess.
 
 # %% editable=true slideshow={"slide_type": ""}
-def compute_Bemd(i_ω_c: Tuple[int, Experiment, float],
+def compute_Bemd(i_ω: Tuple[int, Experiment],
                  #datamodel_risk_c: Tuple[int,DataModel,CandidateModel,CandidateModel,RiskFunction,RiskFunction,float],
                  #riskA: RiskFunction, riskB: RiskFunction,
                  #synth_ppfA: SynthPPF, synth_ppfB: SynthPPF,
                  #candidate_model_A: CandidateModel, candidate_model_B: CandidateModel,
+                 c_list: List[float],
                  Ldata):
     """
     Wrapper for `emdcmp.Bemd`:
-    - Unpack `datamodel_c` into `data_mode
-    - Instantiates models using parameters in `Θtup_c`.
-    - Constructs log-probability functions for `MtheoA` and `MtheoB`.
-    - Generates synthetic observed data using `Mtrue`.
-    - Calls `emdcmp.Bemd`
-
+    - Unpack `i_ω` into the experiment id and the experiment.
+    - Generates synthetic observed data using `ω.data_model`.
+    - Constructs the synthetic and mixed risk PPFs for both candidate models.
+    - Computes Bemd for each value in `c_list`.
+
+    The data and PPFs do not depend on `c`, so they are computed only once.
+    Returns an array of Bemd values, in the same order as `c_list`,
+    alongside the experiment key.
     """
     ## Unpack arg 1 ##  (pool.imap requires iterating over one argument only)
     # i, data_model, candidate_model_A, candidate_model_B, QA, QB, c = datamodel_risk_c
-    i, ω, c = i_ω_c
+    i, ω = i_ω
 
     ## Generate observed data ##
     logger.debug(f"Compute Bemd - Generating {Ldata} data points."); t1 = time.perf_counter()
@@ -336,22 +341,28 @@ def compute_Bemd(i_ω_c: Tuple[int, Experiment, float],
     emdlogginglevel = emdlogger.level
     emdlogger.setLevel(logging.ERROR)
 
-    # NB: Calibration explores some less well-fitted regions, so keeping `res` and `M` high is worthwhile
-    #     (Otherwise we get poor Bemd estimates and need more data.)
-    RA_lst = emd.draw_R_samples(mixed_ppfA, synth_ppfA, c=c)
-    RB_lst = emd.draw_R_samples(mixed_ppfB, synth_ppfB, c=c)
+    Bemd = np.empty(len(c_list))
+    for j, c in enumerate(c_list):
+        # NB: Calibration explores some less well-fitted regions, so keeping `res` and `M` high is worthwhile
+        #     (Otherwise we get poor Bemd estimates and need more data.)
+        # RA samples are sorted as soon as they are drawn, so that RB samples can be compared
+        # against them directly; we never need to hold both unsorted sample arrays at once.
+        RA_sorted = np.sort(emd.draw_R_samples(mixed_ppfA, synth_ppfA, c=c))
+        RB_lst = emd.draw_R_samples(mixed_ppfB, synth_ppfB, c=c)
+
+        ## Compute the EMD criterion ##
+        # Equivalent to `np.less.outer(RA_lst, RB_lst).mean()`, but without allocating an L_A × L_B array:
+        # `searchsorted` counts for each RB sample the number of RA samples strictly below it.
+        Bemd[j] = np.searchsorted(RA_sorted, RB_lst, side="left").sum() / (len(RA_sorted)*len(RB_lst))
 
     # Reset logging level as it was before
     emdlogger.setLevel(emdlogginglevel)
 
     t2 = time.perf_counter()
     logger.debug(f"Compute Bemd - Done generating R samples. Took {t2-t1:.2f} s")
-                     
-    ## Compute the EMD criterion ##
-    Bemd = np.less.outer(RA_lst, RB_lst).mean()
 
     ## Return alongside the experiment key
-    return (i, ω, c), Bemd
+    return (i, ω), Bemd
     # return (i, data_model, QA, QB, c), Bemd
 
 
@@ -375,16 +386,14 @@ def compute_Bconf(data_model, QA, QB, Linf):
 
 
 # %% editable=true slideshow={"slide_type": ""}
-def compute_Bemd_and_maybe_Bconf(i_ω_c, Ldata, Linf, c_conf):
+def compute_Bemd_and_Bconf(i_ω, c_list, Ldata, Linf):
     """Wrapper which calls both `compute_Bemd` and `compute_Bconf`.
-    The latter is only called if `c` matches `c_conf`. 
     
     The reason for this wrapper is to better utilize multiprocessing threads,
     by executing Bconf with the same MP threads as Bemd while still ensuring
     that Bconf is not executed more often than needed.
-    Since Bemd is executed once for every `c` value in `c_list`, we choose
-    one value in `c_list` and make that special: whenever we compute Bemd for
-    that `c`, we also compute Bconf.
+    Since one call to `compute_Bemd` computes Bemd for every `c` value in
+    `c_list`, Bconf is computed exactly once per experiment.
 
     This has three related benefits:
     - If there is caching that might reuse computations between compute_Bemd
@@ -403,13 +412,26 @@ def compute_Bemd_and_maybe_Bconf(i_ω_c, Ldata, Linf, c_conf):
     """
     # NB: Since `data_model` is consumed within this function, even if there
     #     were a bottleneck with imap, it should not exceed memory:
-    #     i, c, Bemd and Bconf are all small scalars.
-    (i, ω, c), Bemd = compute_Bemd(i_ω_c, Ldata)
-    if c == c_conf:
-        Bconf = compute_Bconf(ω.data_model, ω.QA, ω.QB, Linf)
-    else:
-        Bconf = None
-    return i, c, Bemd, Bconf
+    #     i and Bconf are small scalars, and Bemd a small array of scalars.
+    (i, ω), Bemd = compute_Bemd(i_ω, c_list, Ldata)
+    Bconf = compute_Bconf(ω.data_model, ω.QA, ω.QB, Linf)
+    return i, Bemd, Bconf
+
+
+# %% [markdown] editable=true slideshow={"slide_type": ""}
+# When dispatching to MP workers, the arguments which are the same for every task (`c_list`, `Ldata`, `Linf`) are sent once per worker with the pool’s `initializer`, and stored as worker globals. This way the object pickled for each task is only the module-level function `_worker_Bemd_and_Bconf` and its `(i, ω)` argument.
+
+# %% editable=true slideshow={"slide_type": ""}
+_worker_kwargs = {}
+
+def _init_worker(c_list, Ldata, Linf):
+    """Pool initializer: store the arguments shared by all tasks in the worker."""
+    global _worker_kwargs
+    _worker_kwargs = dict(c_list=c_list, Ldata=Ldata, Linf=Linf)
+
+def _worker_Bemd_and_Bconf(i_ω):
+    """Call `compute_Bemd_and_Bconf` with the arguments set by `_init_worker`."""
+    return compute_Bemd_and_Bconf(i_ω, **_worker_kwargs)
 
 
 # %% [markdown] editable=true slideshow={"slide_type": ""}
@@ -472,22 +494,16 @@ class Calibrate:
 # %% [markdown] editable=true slideshow={"slide_type": ""}
 # #### Prepare the runs
 #
-# Bind arguments to the `Bemd` function, so it only take one argument (`datamodel_c`) as required by `imap`.
+# Bind arguments to the `Bemd` function, so it only take one argument (`i_ω`) as required by `imap`.
+# (This is only used without multiprocessing; MP workers receive these arguments through `_init_worker`.)
 
         # %% editable=true slideshow={"slide_type": ""} tags=["skip-execution"]
         # compute_Bemd_partial = partial(compute_Bemd, Ldata=Ldata)
-        compute_partial = partial(compute_Bemd_and_maybe_Bconf,
-                                  Ldata=Ldata, Linf=Linf, c_conf=c_list[0])
-
-# %% [markdown]
-# Define dictionaries into which we will accumulate the results of the $B^{\mathrm{EMD}}$ and $B_{\mathrm{conf}}$ calculations.
-
-        # %% editable=true slideshow={"slide_type": ""} tags=["skip-execution"]
-        Bemd_results = {}
-        Bconf_results = {}
+        compute_partial = partial(compute_Bemd_and_Bconf,
+                                  c_list=c_list, Ldata=Ldata, Linf=Linf)
 
 # %% [markdown]
-# - Set the iterator over parameter combinations (we need two identical ones)
+# - Set the iterator over experiments
 # - Set up progress bar.
 # - Determine the number of multiprocessing cores we will use.
 
@@ -501,31 +517,85 @@ class Calibrate:
             total = N*len(c_list)
         progbar = tqdm(desc="Calib. experiments", total=total)
         ncores = psutil.cpu_count(logical=False)
-        ncores = min(ncores, total, config.mp.max_cores)
+        if hasattr(os, "sched_getaffinity"):
+            # Respect CPU restrictions placed on this process (e.g. by Slurm or taskset)
+            ncores = min(ncores, len(os.sched_getaffinity(0)))
+        ncores = min(ncores, N, config.mp.max_cores)  # One MP task per experiment
+
+# %% [markdown]
+# Define arrays into which we will accumulate the results of the $B^{\mathrm{EMD}}$ and $B_{\mathrm{conf}}$ calculations.
+# Rows are indexed by the experiment id `i`, and `Bemd_results` columns follow the order of `c_list`.
+#
+# Rows not yet completed are marked by NaN values of $B^{\mathrm{EMD}}$.
+#
+# If `config.paths.checkpoints` is set (it is `None` by default), these arrays are memory-mapped to a checkpoint file in that directory, named after the task digest, so that results are saved as soon as they arrive. If the task is interrupted, executing it again with the same parameters skips the experiments which were already completed. The checkpoint file is removed once the task completes.
+
+        # %% editable=true slideshow={"slide_type": ""} tags=["skip-execution"]
+        if config.paths.checkpoints is None:
+            checkpoint_path = checkpoint = None
+            Bemd_results = np.full((N, len(c_list)), np.nan)
+            Bconf_results = np.empty(N, dtype=bool)
+        else:
+            checkpoint_path = config.paths.checkpoints/f"{self.taskname()}_{self.digest}.npy"
+            checkpoint_dtype = np.dtype([("Bemd", float, (len(c_list),)), ("Bconf", bool)])
+            checkpoint = None
+            if checkpoint_path.exists():
+                try:
+                    checkpoint = np.lib.format.open_memmap(checkpoint_path, mode="r+")
+                except (ValueError, OSError):  # E.g. file was only partially written
+                    pass
+                if checkpoint is None or checkpoint.shape != (N,) or checkpoint.dtype != checkpoint_dtype:
+                    logger.warning(f"Checkpoint file '{checkpoint_path}' is unreadable or does not "
+                                   "match this task; it will be discarded and recreated.")
+                    checkpoint = None  # Close the memory map before overwriting its file
+            if checkpoint is None:
+                checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+                checkpoint = np.lib.format.open_memmap(
+                    checkpoint_path, mode="w+", shape=(N,), dtype=checkpoint_dtype)
+                checkpoint["Bemd"] = np.nan
+            Bemd_results = checkpoint["Bemd"]
+            Bconf_results = checkpoint["Bconf"]
+
+        done = ~np.isnan(Bemd_results).any(axis=1)
+        if done.any():
+            logger.info(f"Resuming from checkpoint '{checkpoint_path}': "
+                        f"{done.sum()} of {N} experiments were already completed.")
+            progbar.update(done.sum()*len(c_list))
+        N_todo = N - done.sum()
+        ncores = min(ncores, N_todo)
 
 # %% [markdown]
 # #### Run the experiments
 # Since there are a lot of them, and they each take a few minutes, we use multiprocessing to run them in parallel.
 
         # %% editable=true slideshow={"slide_type": ""} tags=["skip-execution"]
-        ω_c_gen = ((i, ω, c)  # i is used as an id for each different model/Qs set
-                        for i, ω in enumerate(experiments)
-                        for c in c_list)
+        ω_gen = ((i, ω) for i, ω in enumerate(experiments)  # i is used as an id for each different model/Qs set
+                 if not done[i])
 
         if ncores > 1:
-            with mp.Pool(ncores, maxtasksperchild=config.mp.maxtasksperchild) as pool:
-                # Chunk size calculated following mp.Pool's algorithm (See https://stackoverflow.com/questions/53751050/multiprocessing-understanding-logic-behind-chunksize/54813527#54813527)
-                # (Naive approach would be total/ncores. This is most efficient if all taskels take the same time. Smaller chunks == more flexible job allocation, but more overhead)
-                chunksize, extra = divmod(N, ncores*6)
-                if extra:
-                    chunksize += 1
-                Bemd_Bconf_it = pool.imap_unordered(compute_partial, ω_c_gen,
+            t1 = time.perf_counter()
+            mp_context = mp.get_context(config.mp.start_method)
+            with mp_context.Pool(ncores, maxtasksperchild=config.mp.maxtasksperchild,
+                                 initializer=_init_worker,
+                                 initargs=(c_list, Ldata, Linf)) as pool:
+                if checkpoint is not None:
+                    # Results are only returned once their whole chunk is done: use single-task chunks,
+                    # so that each result is checkpointed as soon as it is computed.
+                    chunksize = 1
+                else:
+                    # Chunk size calculated following mp.Pool's algorithm (See https://stackoverflow.com/questions/53751050/multiprocessing-understanding-logic-behind-chunksize/54813527#54813527)
+                    # (Naive approach would be total/ncores. This is most efficient if all taskels take the same time. Smaller chunks == more flexible job allocation, but more overhead)
+                    chunksize, extra = divmod(N_todo, ncores*6)
+                    if extra:
+                        chunksize += 1
+                Bemd_Bconf_it = pool.imap_unordered(_worker_Bemd_and_Bconf, ω_gen,
                                                     chunksize=chunksize)
-                for (i, c, Bemd, Bconf) in Bemd_Bconf_it:
-                    progbar.update(1)        # Updating first more reliable w/ ssh
-                    Bemd_results[i, c] = Bemd
-                    if Bconf is not None:
-                        Bconf_results[i] = Bconf
+                for (i, Bemd, Bconf) in Bemd_Bconf_it:
+                    progbar.update(len(c_list))  # Updating first more reliable w/ ssh
+                    Bconf_results[i] = Bconf
+                    Bemd_results[i] = Bemd     # Written last: non-NaN Bemd marks the row as done
+                    if checkpoint is not None:
+                        checkpoint.flush()
                 # Bemd_it = pool.imap(compute_Bemd_partial, ω_c_gen,
                 #                     chunksize=chunksize)
                 # for (i, data_model, QA, QB, c), Bemd_res in Bemd_it:
@@ -533,18 +603,26 @@ class Calibrate:
                 #     Bemd_results[i, c] = Bemd_res
                 #     if i not in Bconf_results:
                 #         Bconf_results[i] = compute_Bconf(data_model, QA, QB, Linf)
+            t2 = time.perf_counter()
+            # Starting a pool has a fixed cost (with 'spawn', each worker re-imports NumPy, SciPy, etc.)
+            # If experiments are very short, this cost dominates and running serially is faster.
+            if (t2 - t1) * ncores / N_todo < config.mp.min_task_time:
+                logger.warning(f"Calibration experiments took on average only {(t2-t1)*ncores/N_todo:.2f} s "
+                               "each, which is too short to benefit from multiprocessing. "
+                               "For runs of this size, consider setting `config.mp.max_cores = 1`.")
 
 # %% [markdown] editable=true slideshow={"slide_type": ""}
 # Variant without multiprocessing:
 
         # %% editable=true slideshow={"slide_type": ""}
         else:
-            Bemd_Bconf_it = (compute_partial(arg) for arg in ω_c_gen)
-            for (i, c, Bemd, Bconf) in Bemd_Bconf_it:
-                progbar.update(1)
-                Bemd_results[i, c] = Bemd
-                if Bconf is not None:
-                    Bconf_results[i] = Bconf
+            Bemd_Bconf_it = (compute_partial(arg) for arg in ω_gen)
+            for (i, Bemd, Bconf) in Bemd_Bconf_it:
+                progbar.update(len(c_list))
+                Bconf_results[i] = Bconf
+                Bemd_results[i] = Bemd     # Written last: non-NaN Bemd marks the row as done
+                if checkpoint is not None:
+                    checkpoint.flush()
             # Bemd_it = (compute_Bemd_partial(arg) for arg in ω_c_gen)
             # for (i, data_model, QA, QB, c), Bemd_res in Bemd_it:
             #     progbar.update(1)        # Updating first more reliable w/ ssh
@@ -572,9 +650,13 @@ class Calibrate:
 # :::
 
         # %% editable=true slideshow={"slide_type": ""} tags=["skip-execution", "remove-cell"]
-        # NB: Don’t just use list(Bemd_results.values()): order of dictionary is not guaranteed
-        return dict(Bemd =[Bemd_results [i,c] for i in range(len(experiments)) for c in c_list],
-                    Bconf=[Bconf_results[i]   for i in range(len(experiments))])
+        # NB: Flattening row-major orders Bemd values by experiment, then by c
+        result = dict(Bemd =Bemd_results.ravel().tolist(),
+                      Bconf=Bconf_results.tolist())
+        if checkpoint_path is not None:
+            del Bemd_results, Bconf_results, checkpoint  # Close the memory map before removing its file
+            checkpoint_path.unlink()
+        return result
 
 # %% [markdown] tags=["remove-cell"] editable=true slideshow={"slide_type": ""}
 # > **END OF `Calibrate.__call__`**
@@ -589,23 +671,18 @@ class Calibrate:
         """
         assert len(result.Bemd) == len(self.c_list) * len(result.Bconf), \
             "`result` argument seems not to have been created with this task."
-        # Reconstruct the dictionary as it was at the end of task execution
-        Bemd_dict = {}; Bemd_it = iter(result.Bemd)
-        Bconf_dict = {}; Bconf_it = iter(result.Bconf)
-        for i in range(len(result.Bconf)):         # We don’t actually need the models
-            Bconf_dict[i] = next(Bconf_it)         # => we just use integer ids
-            for c in self.taskinputs.c_list:       # This avoids unnecessarily
-                Bemd_dict[i, c] = next(Bemd_it)  # instantiating models.
-        # for data_model in self.taskinputs.models:
-        #     Bconf_dict[data_model] = next(Bconf_it)
-        #     for c in self.taskinputs.c_list:
-        #         Bemd_dict[(data_model, c)] = next(Bemd_it)
+        # `result.Bemd` is ordered by experiment, then by c, so it reshapes to
+        # an (N, |c_list|) array. We don’t actually need the models, which
+        # avoids unnecessarily instantiating them.
+        c_list = self.taskinputs.c_list
+        N = len(result.Bconf)
+        Bemd_arr = np.asarray(result.Bemd, dtype=float).reshape(N, len(c_list))
+        Bconf_arr = np.asarray(result.Bconf, dtype=bool)
         # Package results into a record arrays – easier to sort and plot
-        calib_curve_data = {c: [] for c in self.taskinputs.c_list}
-        for i, c in Bemd_dict:
-            calib_curve_data[c].append(
-                (Bemd_dict[i, c], Bconf_dict[i]) )
-
-        #return UnpackedCalibrateResult(Bemd=Bemd_dict, Bconf=Bconf_dict)
-        return {c: np.array(calib_curve_data[c], dtype=calib_point_dtype)
-                for c in self.taskinputs.c_list}
+        calib_curve_data = {}
+        for j, c in enumerate(c_list):
+            calib_curve_data[c] = np.empty(N, dtype=calib_point_dtype)
+            calib_curve_data[c]["Bemd"] = Bemd_arr[:, j]
+            calib_curve_data[c]["Bconf"] = Bconf_arr
+
+        return calib_curve_data
@@ -0,0 +1,123 @@
+import logging
+import multiprocessing as mp
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("smttask")
+
+from emdcmp import config
+from emdcmp import tasks
+
+
+class FakeTask:
+    """Stand-in for a `Calibrate` instance, providing only what `__call__` uses."""
+    digest = "0123456789"
+    @staticmethod
+    def taskname():
+        return "Calibrate"
+
+
+@pytest.fixture
+def serial_calibrate(monkeypatch, tmp_path):
+    """Run `Calibrate.__call__` serially, with a checkpoint directory and a
+    fake (fast) `compute_Bemd_and_Bconf` which records the experiments it computes."""
+    computed = []
+    def fake_compute_Bemd_and_Bconf(i_ω, c_list, Ldata, Linf):
+        i, ω = i_ω
+        computed.append(i)
+        return i, np.full(len(c_list), float(i)), i % 2 == 0
+    monkeypatch.setattr(tasks, "compute_Bemd_and_Bconf", fake_compute_Bemd_and_Bconf)
+    monkeypatch.setattr(config.mp, "max_cores", 1)
+    monkeypatch.setattr(config.paths, "checkpoints", tmp_path)
+    checkpoint_path = tmp_path/"Calibrate_0123456789.npy"
+    def run(N, c_list):
+        return tasks.Calibrate.__call__(FakeTask(), c_list=c_list, experiments=list(range(N)),
+                                        Ldata=10, Linf=100)
+    return run, computed, checkpoint_path
+
+
+def test_calibrate_resume_from_checkpoint(serial_calibrate):
+    run, computed, checkpoint_path = serial_calibrate
+    N, c_list = 6, [0.5, 1., 2.]
+
+    # Simulate an interrupted run, where experiments 1 and 4 were completed
+    checkpoint = np.lib.format.open_memmap(
+        checkpoint_path, mode="w+", shape=(N,),
+        dtype=[("Bemd", float, (len(c_list),)), ("Bconf", bool)])
+    checkpoint["Bemd"] = np.nan
+    checkpoint["Bemd"][[1, 4]] = -1.
+    checkpoint["Bconf"][[1, 4]] = True
+    # Interrupted between the writes of Bconf and Bemd: must be recomputed
+    checkpoint["Bconf"][3] = True
+    checkpoint.flush()
+    del checkpoint
+
+    result = run(N, c_list)
+
+    # Only the remaining rows were computed
+    assert sorted(computed) == [0, 2, 3, 5]
+    Bemd = np.array(result["Bemd"]).reshape(N, len(c_list))
+    assert np.array_equal(Bemd[[1, 4]], np.full((2, len(c_list)), -1.))
+    assert np.array_equal(Bemd[[0, 2, 3, 5]], np.repeat([[0.], [2.], [3.], [5.]], len(c_list), axis=1))
+    assert result["Bconf"] == [True, True, True, False, True, False]
+    # Checkpoint file is removed on completion
+    assert not checkpoint_path.exists()
+
+
+def test_calibrate_discards_mismatched_checkpoint(serial_calibrate, caplog):
+    run, computed, checkpoint_path = serial_calibrate
+    N, c_list = 4, [0.5, 1.]
+
+    # Checkpoint from a run with a different c_list: incompatible dtype
+    checkpoint = np.lib.format.open_memmap(
+        checkpoint_path, mode="w+", shape=(N,),
+        dtype=[("Bemd", float, (3,)), ("Bconf", bool)])
+    checkpoint["Bemd"] = -1.
+    del checkpoint
+
+    with caplog.at_level(logging.WARNING):
+        result = run(N, c_list)
+
+    assert "will be discarded" in caplog.text
+    assert sorted(computed) == list(range(N))
+    assert result["Bemd"] == [0., 0., 1., 1., 2., 2., 3., 3.]
+    assert not checkpoint_path.exists()
+
+
+@pytest.mark.skipif("fork" not in mp.get_all_start_methods(),
+                    reason="Test relies on workers inheriting the monkeypatched compute function.")
+def test_calibrate_multiprocessing_with_checkpoint(monkeypatch, tmp_path):
+    parent_pid = os.getpid()
+    def fake_compute_Bemd_and_Bconf(i_ω, c_list, Ldata, Linf):
+        i, ω = i_ω
+        # c_list is only available if `_init_worker` was run;
+        # Bconf records whether we actually ran in a worker process
+        return i, i + np.array(c_list), os.getpid() != parent_pid
+    monkeypatch.setattr(tasks, "compute_Bemd_and_Bconf", fake_compute_Bemd_and_Bconf)
+    monkeypatch.setattr(tasks.psutil, "cpu_count", lambda logical=True: 2)
+    monkeypatch.setattr(tasks.os, "sched_getaffinity", lambda pid: {0, 1}, raising=False)
+    monkeypatch.setattr(config.mp, "max_cores", 2)
+    monkeypatch.setattr(config.mp, "start_method", "fork")
+    monkeypatch.setattr(config.paths, "checkpoints", tmp_path)
+    checkpoint_path = tmp_path/"Calibrate_0123456789.npy"
+    N, c_list = 8, [0.5, 1.]
+
+    # Resume from a checkpoint where experiment 2 was completed
+    checkpoint = np.lib.format.open_memmap(
+        checkpoint_path, mode="w+", shape=(N,),
+        dtype=[("Bemd", float, (len(c_list),)), ("Bconf", bool)])
+    checkpoint["Bemd"] = np.nan
+    checkpoint["Bemd"][2] = -1.
+    checkpoint.flush()
+    del checkpoint
+
+    result = tasks.Calibrate.__call__(FakeTask(), c_list=c_list, experiments=list(range(N)),
+                                      Ldata=10, Linf=100)
+
+    Bemd = np.array(result["Bemd"]).reshape(N, len(c_list))
+    expected = np.arange(N)[:,None] + np.array(c_list)
+    expected[2] = -1.
+    assert np.array_equal(Bemd, expected)
+    assert result["Bconf"] == [i != 2 for i in range(N)]
+    assert not checkpoint_path.exists()